@@ -17,6 +17,7 @@ System requirement:
 import os
 import sys
 import ftplib
+import socket
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from pathlib import Path
@@ -24,51 +25,354 @@ import threading
 import queue
 import rarfile
 import shutil
+import stat
 import time
 import json
+import re
+import functools
+import multiprocessing
+import pickle
+import hashlib
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import datetime
 
 APP_TITLE = "FTP RAR Downloader"
 DEFAULT_PORT = 21
 CONFIG_PATH = Path.home() / ".ftp_rar_gui.json"
+DEFAULT_BLOCKSIZE = 256 * 1024   # có thể chỉnh qua khóa "blocksize" trong config
+FILE_BUFFERING = 1024 * 1024    # kích thước mỗi lần ghi xuống đĩa
+EXTRACT_BUFFERING = 1 << 20
+EXTRACT_WORKERS = 8
+SOCK_RCVBUF = 1 << 20
+DEFAULT_POOL_SIZE = 4            # số phiên FTP song song khi tải nhiều file
+# Dòng LIST kiểu Unix: mode links owner [group] size month day time/year name
+_LIST_RE = re.compile(r"^(\S+)\s+\S+\s+\S+(?:\s+\S+)?\s+(\d+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(.+)$")
+# Dòng LIST kiểu DOS/IIS: 01-15-20  10:30AM  <DIR>  name
+_LIST_DOS_RE = re.compile(r"^(\d{2}-\d{2}-\d{2,4})\s+(\d{1,2}:\d{2}\s*[AaPp][Mm])\s+(<DIR>|\d+)\s+(.+)$")
+_PART_RE = re.compile(r"^(.*\.part)(\d+)(\.rar)$", re.IGNORECASE)
+_LIST_TOTAL_RE = re.compile(r"^total\s+\d+\s*$")
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB", "PB")
+LOG_FLUSH_MS = 100               # gom log, tối đa ~10 lần ghi vào ô log mỗi giây
+LOG_BUFFER_MAX = 2000
+PROGRESS_INTERVAL = 0.05         # tối đa ~20 lần cập nhật tiến trình mỗi giây
+
+
+_cfg_digest = None   # hash của nội dung config đã ghi/đọc gần nhất
+
+
+def _dump_config(cfg: dict) -> bytes:
+    return json.dumps(cfg, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8")
 
 
 def load_config():
+    global _cfg_digest
     try:
         with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+            cfg = json.load(f)
     except Exception:
         return {}
+    try:
+        _cfg_digest = hashlib.blake2b(_dump_config(cfg)).digest()
+    except Exception:
+        pass
+    return cfg
 
 
 def save_config(cfg: dict):
+    global _cfg_digest
     try:
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump(cfg, f, ensure_ascii=False, indent=2)
+        data = _dump_config(cfg)
+        digest = hashlib.blake2b(data).digest()
+        if digest == _cfg_digest:
+            # Không có gì thay đổi -> bỏ qua ghi đĩa
+            return
+        # Ghi ra file tạm rồi os.replace để không bao giờ để lại config hỏng
+        tmp_path = CONFIG_PATH.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, CONFIG_PATH)
+        _cfg_digest = digest
     except Exception:
         pass
 
 
+@functools.lru_cache(maxsize=4096)
+def _format_date(date_str: str) -> str:
+    # Nhiều file có cùng mtime -> memoize để không strptime lặp lại
+    try:
+        # Cắt bỏ phần mili-giây nếu có
+        if "." in date_str:
+            date_str = date_str.split(".")[0]
+        dt = datetime.strptime(date_str, "%Y%m%d%H%M%S")
+        return dt.strftime("%d/%m/%Y %H:%M:%S")
+    except:
+        return date_str
+
+
+def _first_volume_name(name: str):
+    """Tên phần đầu của RAR nhiều phần kiểu name.partN.rar (giữ số chữ số), None nếu không nhận ra."""
+    m = _PART_RE.match(name)
+    if not m:
+        return None
+    return f"{m.group(1)}{'1'.zfill(len(m.group(2)))}{m.group(3)}"
+
+
+def _volume_group(name: str) -> str:
+    """Khoá nhóm (tên phần đầu, chữ thường) của một tập tin: name.partN.rar và name.rNN chung nhóm với phần đầu."""
+    first = _first_volume_name(name)
+    if first is None:
+        p = Path(name)
+        first = p.stem + ".rar" if re.fullmatch(r"\.r\d\d", p.suffix, re.IGNORECASE) else name
+    return first.lower()
+
+
+def _extract_rar_worker(rar_path: str, dest_dir: str, overwrite: bool):
+    """Giải nén rar_path vào dest_dir. Hàm cấp module để chạy được trong tiến trình con.
+
+    Trả về None nếu thành công, hoặc tuple (loại, thông báo, volume) khi gặp NeedFirstVolume
+    (exception này không pickle được qua ranh giới tiến trình).
+    """
+    try:
+        _extract_rar_local(Path(rar_path), Path(dest_dir), overwrite)
+    except rarfile.NeedFirstVolume as e:
+        return ("need_first_volume", str(e), e.current_volume)
+    return None
+
+
+def _extract_rar_child(conn, rar_path: str, dest_dir: str, overwrite: bool):
+    """Điểm vào của tiến trình con giải nén: gửi ("ok", kết quả) hoặc ("err", exception) qua pipe."""
+    try:
+        result = ("ok", _extract_rar_worker(rar_path, dest_dir, overwrite))
+    except Exception as e:
+        try:
+            pickle.loads(pickle.dumps(e))
+            result = ("err", e)
+        except Exception:
+            result = ("err", Exception(f"{type(e).__name__}: {e}"))
+    conn.send(result)
+    conn.close()
+
+
+def _is_within(path: str, root: str) -> bool:
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:
+        # Khác ổ đĩa (Windows) hoặc trộn đường dẫn tuyệt đối/tương đối
+        return False
+
+
+class _PathGuard:
+    """Kiểm tra realpath của thư mục cha nằm trong thư mục đích, memoize theo thư mục.
+
+    Kiểm tra từ vựng (normpath/commonpath) không đủ: một symlink có sẵn trong thư mục
+    đích (vd. do archive trước tạo) sẽ bị đi theo khi ghi file.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._ok: dict[str, bool] = {}
+
+    def check(self, dir_str: str, member_name: str):
+        ok = self._ok.get(dir_str)
+        if ok is None:
+            ok = self._ok[dir_str] = _is_within(os.path.realpath(dir_str), self.root)
+        if not ok:
+            raise Exception(f"Unsafe path in archive: {member_name}")
+
+    def reset(self):
+        # Gọi sau khi tạo symlink: kết quả realpath đã memoize có thể không còn đúng
+        self._ok.clear()
+
+
+def _extract_rar_local(rar_path: Path, dest_dir: Path, overwrite: bool):
+    # Resolve thư mục đích một lần; realpath từng thư mục cha được memoize trong _PathGuard
+    dest_root_str = os.path.realpath(dest_dir)
+    dest_dir = Path(dest_root_str)
+    guard = _PathGuard(dest_root_str)
+    with rarfile.RarFile(rar_path) as rf:
+        jobs = []
+        links = []
+        for m in rf.infolist():
+            # Cùng cách đặt tên như rf.extract: thay ký tự không hợp lệ trên Windows (: * ? ...)
+            name_posix = rarfile.sanitize_filename(m.filename, "/", sys.platform == "win32")
+            target_str = os.path.normpath(os.path.join(dest_root_str, name_posix))
+            if target_str == dest_root_str and m.is_dir():
+                continue
+            # Guard against path traversal
+            if target_str == dest_root_str or not _is_within(target_str, dest_root_str):
+                raise Exception(f"Unsafe path in archive: {m.filename}")
+            target = Path(target_str)
+            if m.is_dir():
+                guard.check(target_str, m.filename)
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            guard.check(str(target.parent), m.filename)
+            if m.is_symlink():
+                # Tạo symlink sau cùng để file thường không bao giờ đi qua link của chính archive này
+                links.append((m, target))
+                continue
+            # Ensure parent
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if not _prepare_target(target, overwrite):
+                continue
+            jobs.append((m, target))
+
+        # Archive solid/có mật khẩu phải giải nén tuần tự (rarfile không an toàn đa luồng);
+        # member trùng tên cũng vậy để giữ thứ tự ghi
+        parallel = (len(jobs) > 1 and not rf.needs_password() and not rf.is_solid()
+                    and len({t for _, t in jobs}) == len(jobs))
+        if parallel:
+            with ThreadPoolExecutor(max_workers=min(EXTRACT_WORKERS, os.cpu_count() or 1)) as ex:
+                # list() để ném lại lỗi của từng member
+                list(ex.map(lambda job: _extract_one(rf, job[0], job[1], guard), jobs))
+        else:
+            for m, target in jobs:
+                _extract_one(rf, m, target, guard)
+
+        for m, target in links:
+            # Kiểm tra lại (không dùng memo) vì các symlink trước có thể đổi đường dẫn
+            guard.reset()
+            guard.check(str(target.parent), m.filename)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if _prepare_target(target, overwrite):
+                # rarfile còn tự kiểm tra đích của link không ra ngoài thư mục đích
+                rf.extract(m, path=dest_dir)
+        guard.reset()
+
+
+def _prepare_target(target: Path, overwrite: bool) -> bool:
+    """Xử lý file/folder trùng tên. Trả về False nếu phải bỏ qua member."""
+    # Một lần lstat thay cho nhiều lần exists()
+    try:
+        st = target.lstat()
+    except FileNotFoundError:
+        return True
+    if not overwrite:
+        return False
+    try:
+        if stat.S_ISDIR(st.st_mode):
+            shutil.rmtree(target)
+        else:
+            target.unlink()
+    except Exception:
+        pass
+    return True
+
+
+def _extract_one(rf: rarfile.RarFile, m: rarfile.RarInfo, target: Path, guard: _PathGuard):
+    # Kiểm tra ngay trước khi ghi (memoize theo thư mục cha)
+    guard.check(str(target.parent), m.filename)
+    # Giải nén theo luồng với buffer 1 MiB
+    with rf.open(m) as src, open(target, "wb", buffering=EXTRACT_BUFFERING) as dst:
+        shutil.copyfileobj(src, dst, length=EXTRACT_BUFFERING)
+    _set_member_attrs(m, target)
+
+
+def _set_member_attrs(m: rarfile.RarInfo, target: Path):
+    # Giống RarFile._set_attrs mà rf.extract vẫn gọi: quyền file + mtime/atime
+    try:
+        if m.host_os == rarfile.RAR_OS_UNIX:
+            os.chmod(target, m.mode & 0o777)
+        elif m.host_os in (rarfile.RAR_OS_WIN32, rarfile.RAR_OS_MSDOS):
+            # chỉ giữ thuộc tính chỉ-đọc
+            if m.mode & rarfile.DOS_MODE_READONLY:
+                os.chmod(target, os.stat(target).st_mode & ~0o222)
+    except OSError:
+        pass
+    if m.mtime:
+        try:
+            # mtime của RAR5 có múi giờ (UTC) -> timestamp() không lệch theo TZ máy
+            mtime = m.mtime.timestamp()
+            atime = m.atime.timestamp() if m.atime else mtime
+            os.utime(target, (atime, mtime))
+        except (OSError, ValueError, OverflowError):
+            pass
+
+
+class _FTP(ftplib.FTP):
+    """ftplib.FTP với tuỳ chỉnh socket cho kết nối dữ liệu."""
+
+    def ntransfercmd(self, cmd, rest=None):
+        conn, size = super().ntransfercmd(cmd, rest)
+        try:
+            # Mở rộng cửa sổ nhận TCP cho kênh dữ liệu
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_RCVBUF)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+        return conn, size
+
+
 class FTPClient:
+    _LIST_TTL = 10.0        # giây
+    _LIST_CACHE_MAX = 128
+
     def __init__(self):
         self.ftp: ftplib.FTP | None = None
         self.current_path = "/"
+        # cache danh sách thư mục: path -> (thời điểm, entries)
+        self._list_cache: OrderedDict[str, tuple[float, list]] = OrderedDict()
+        self._supports_mlsd = True
+        self._abort = threading.Event()
+        self._data_conn: socket.socket | None = None
+        # (host, port, user, password) của lần connect thành công gần nhất
+        self.credentials: tuple[str, int, str, str] | None = None
 
     def connect(self, host: str, port: int, user: str, password: str, timeout: int = 20):
         self.close()
-        ftp = ftplib.FTP()
+        self._abort.clear()
+        ftp = _FTP()
         ftp.connect(host, port, timeout=timeout)
+        try:
+            # Tắt Nagle: lệnh điều khiển ngắn không phải chờ delayed-ACK
+            ftp.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
         ftp.login(user=user, passwd=password)
         _ = ftp.getwelcome()
         ftp.voidcmd("TYPE I")
+        try:
+            # Dò khả năng server một lần (RFC 3659: hỗ trợ MLST ngụ ý có MLSD)
+            feats = ftp.sendcmd("FEAT")
+            self._supports_mlsd = "MLST" in feats.upper()
+        except ftplib.all_errors:
+            self._supports_mlsd = True   # không rõ -> thử MLSD, lỗi thì fallback LIST
+        if self._supports_mlsd:
+            try:
+                # Chỉ yêu cầu các fact mà UI dùng để rút gọn dữ liệu MLSD
+                ftp.voidcmd("OPTS MLST type;size;modify;")
+            except ftplib.all_errors:
+                pass
         self.ftp = ftp
+        self.credentials = (host, port, user, password)
         try:
             self.current_path = ftp.pwd()
         except Exception:
             self.current_path = "/"
         return True
 
+    def abort(self):
+        """Huỷ transfer đang chạy (gọi được từ luồng khác) và đóng kết nối không chờ server."""
+        self._abort.set()
+        conn, ftp = self._data_conn, self.ftp
+        if conn is not None:
+            try:
+                # shutdown đánh thức recv_into đang chặn ở luồng tải
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if ftp is not None:
+            try:
+                ftp.close()
+            except Exception:
+                pass
+        self.ftp = None
+        self.invalidate()
+
     def close(self):
+        self.invalidate()
         if self.ftp is not None:
             try:
                 self.ftp.quit()
@@ -84,45 +388,91 @@ class FTPClient:
         self.ftp.cwd(path)
         self.current_path = self.ftp.pwd()
 
+    def invalidate(self, path: str = None):
+        """Xoá cache listing của một thư mục (hoặc toàn bộ nếu path=None)."""
+        if path is None:
+            self._list_cache.clear()
+        else:
+            self._list_cache.pop(path, None)
+
     def listdir(self, path: str = None):
         assert self.ftp is not None, "Not connected"
         if path is None:
             path = self.current_path
-        entries = []
-        try:
-            for name, facts in self.ftp.mlsd(path):
-                entries.append({
-                    "name": name,
-                    "type": facts.get("type", "file"),
-                    "size": int(facts.get("size", 0)) if facts.get("size") else 0,
-                    "modify": facts.get("modify", ""),
-                })
-        except (ftplib.error_perm, AttributeError):
+        cached = self._list_cache.get(path)
+        if cached is not None and time.monotonic() - cached[0] < self._LIST_TTL:
+            self._list_cache.move_to_end(path)
+            return cached[1]
+        entries = None
+        if self._supports_mlsd:
+            try:
+                entries = []
+                for name, facts in self.ftp.mlsd(path):
+                    entries.append({
+                        "name": name,
+                        "type": facts.get("type", "file"),
+                        "size": int(facts.get("size", 0)) if facts.get("size") else 0,
+                        "modify": facts.get("modify", ""),
+                    })
+            except ftplib.error_perm as e:
+                # Chỉ nhớ "không hỗ trợ" khi server trả lời lệnh chưa cài đặt;
+                # lỗi khác (vd. 550) chỉ fallback LIST cho lần gọi này
+                if str(e)[:3] in ("500", "502", "504"):
+                    self._supports_mlsd = False
+                entries = None
+            except AttributeError:
+                entries = None
+        if entries is None:
+            entries = []
             lines = []
             self.ftp.retrlines(f"LIST {path}", lines.append)
+            rows = []
+            match = _LIST_RE.match
             for line in lines:
-                parts = line.split(maxsplit=8)
-                if len(parts) < 9:
-                    name = parts[-1] if parts else line
-                    entries.append({"name": name, "type": "file", "size": 0, "modify": ""})
+                m = match(line)
+                if m:
+                    mode, size, month, day, time_or_year, name = m.groups()
+                    rows.append((name, "dir" if mode.startswith("d") else "file", int(size), f"{day} {month} {time_or_year}"))
                     continue
-                mode, _, _, _, size, month, day, time_or_year, name = parts
-                is_dir = mode.startswith("d")
-                entries.append({
-                    "name": name,
-                    "type": "dir" if is_dir else "file",
-                    "size": int(size) if size.isdigit() else 0,
-                    "modify": f"{day} {month} {time_or_year}",
-                })
+                m = _LIST_DOS_RE.match(line)
+                if m:
+                    date, tm, size, name = m.groups()
+                    is_dir = size == "<DIR>"
+                    rows.append((name, "dir" if is_dir else "file", 0 if is_dir else int(size), f"{date} {tm}"))
+                    continue
+                if not line.strip() or _LIST_TOTAL_RE.match(line):
+                    continue
+                # Định dạng không nhận ra: vẫn hiện tên như trước
+                parts = line.split(maxsplit=8)
+                rows.append((parts[-1], "file", 0, ""))
+            entries = [{"name": n, "type": t, "size": sz, "modify": md} for n, t, sz, md in rows]
         entries = [e for e in entries if e["name"] not in (".",)]
         dirs = [e for e in entries if e["type"] == "dir"]
         files = [e for e in entries if e["type"] != "dir"]
         dirs.sort(key=lambda x: x["name"].lower())
         files.sort(key=lambda x: x["name"].lower())
-        return [{"name": "..", "type": "up", "size": 0, "modify": ""}] + dirs + files
-
-    def download_file(self, remote_path: str, local_path: str, progress_cb=None, blocksize: int = 64*1024, rest: int = 0):
+        result = [{"name": "..", "type": "up", "size": 0, "modify": ""}] + dirs + files
+        # Định dạng sẵn trong luồng nền để luồng UI chỉ việc insert
+        for e in result:
+            e["size_str"] = FTPClient.format_size(e["size"]) if e["size"] else ""
+            e["modify_str"] = FTPClient.format_date(e["modify"]) if e["modify"] else ""
+        self._list_cache[path] = (time.monotonic(), result)
+        self._list_cache.move_to_end(path)
+        while len(self._list_cache) > self._LIST_CACHE_MAX:
+            self._list_cache.popitem(last=False)
+        return result
+
+    def download_file(self, remote_path: str, local_path: str, progress_cb=None, blocksize: int = DEFAULT_BLOCKSIZE, rest: int = 0):
+        """Tải remote_path về local_path (resume từ byte rest nếu > 0).
+
+        Không dùng retrbinary: đọc trực tiếp socket dữ liệu của transfercmd bằng
+        recv_into (tối đa blocksize byte mỗi lần) vào buffer cấp phát sẵn, nên không
+        tạo bytes mới cho từng block. progress_cb(done, total) được gọi sau mỗi block
+        như trước; bên gọi (UI) tự giới hạn tần suất cập nhật.
+        """
         assert self.ftp is not None, "Not connected"
+        # retrlines/mlsd chuyển sang TYPE A; transfercmd không tự đặt lại
+        self.ftp.voidcmd("TYPE I")
         total_size = None
         try:
             total_size = self.ftp.size(remote_path)
@@ -130,18 +480,52 @@ class FTPClient:
             pass
 
         mode = "ab" if rest > 0 else "wb"
-        with open(local_path, mode) as f:
+        # File không đệm: tự gom dữ liệu vào buffer staging và ghi ~1 MiB mỗi syscall
+        with open(local_path, mode, buffering=0) as f:
+            self._advise_sequential(f.fileno())
             bytes_done = rest
-            def _writer(block):
-                nonlocal bytes_done, total_size
-                f.write(block)
-                bytes_done += len(block)
-                if progress_cb:
-                    progress_cb(bytes_done, total_size)
-            if rest > 0:
-                self.ftp.retrbinary(f"RETR {remote_path}", _writer, blocksize=blocksize, rest=rest)
-            else:
-                self.ftp.retrbinary(f"RETR {remote_path}", _writer, blocksize=blocksize)
+            # Đọc thẳng từ socket dữ liệu vào buffer cấp phát sẵn (không tạo bytes mỗi block)
+            buf = bytearray(max(FILE_BUFFERING, blocksize))
+            mv = memoryview(buf)
+            filled = 0
+            try:
+                with self.ftp.transfercmd(f"RETR {remote_path}", rest=rest or None) as conn:
+                    self._data_conn = conn
+                    while True:
+                        n = conn.recv_into(mv[filled:], min(blocksize, len(buf) - filled))
+                        if not n or self._abort.is_set():
+                            break
+                        filled += n
+                        bytes_done += n
+                        if filled == len(buf):
+                            self._write_all(f, mv[:filled])
+                            filled = 0
+                        if progress_cb:
+                            progress_cb(bytes_done, total_size)
+                if self._abort.is_set():
+                    raise Exception("Đã huỷ tải xuống")
+                self.ftp.voidresp()
+            finally:
+                self._data_conn = None
+                # Ghi nốt phần đã nhận (kể cả khi lỗi) để resume tiếp đúng vị trí
+                if filled:
+                    self._write_all(f, mv[:filled])
+
+    @staticmethod
+    def _write_all(f, view: memoryview):
+        # FileIO.write có thể ghi thiếu
+        while view:
+            view = view[f.write(view):]
+
+    @staticmethod
+    def _advise_sequential(fd: int):
+        # Báo kernel ghi tuần tự (POSIX). Không preallocate: resume dựa vào kích thước
+        # file cục bộ, file dài sẵn sẽ làm hỏng resume nếu tiến trình bị kill giữa chừng.
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
 
     @staticmethod
     def format_size(size: int) -> str:
@@ -150,22 +534,77 @@ class FTPClient:
             size = float(size)
         except Exception:
             return ""
-        for unit in ["B", "KB", "MB", "GB", "TB"]:
-            if size < 1024:
-                return f"{size:.2f} {unit}"
-            size /= 1024
-        return f"{size:.2f} PB"
+        if size < 1024:
+            return f"{size:.2f} B"
+        # Chỉ số đơn vị = floor(log2(size) / 10), tối đa PB
+        i = min((int(size).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+        return f"{size / (1 << (i * 10)):.2f} {_SIZE_UNITS[i]}"
 
     @staticmethod
     def format_date(date_str: str) -> str:
+        return _format_date(date_str)
+
+
+class FTPPool:
+    """Nhóm phiên FTP (mỗi phiên một FTPClient) để tải nhiều file song song."""
+
+    def __init__(self, host: str, port: int, user: str, password: str, size: int = DEFAULT_POOL_SIZE):
+        self.host, self.port, self.user, self.password = host, port, user, password
+        self.size = max(1, size)
+        self._idle: queue.Queue[FTPClient] = queue.Queue()
+        self._all: list[FTPClient] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> FTPClient:
         try:
-            # Cắt bỏ phần mili-giây nếu có
-            if "." in date_str:
-                date_str = date_str.split(".")[0]
-            dt = datetime.strptime(date_str, "%Y%m%d%H%M%S")
-            return dt.strftime("%d/%m/%Y %H:%M:%S")
-        except:
-            return date_str
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = len(self._all) < self.size
+            if create:
+                client = FTPClient()
+                self._all.append(client)
+        if not create:
+            return self._idle.get()
+        try:
+            # Tạo kết nối lười (chỉ khi cần)
+            client.connect(self.host, self.port, self.user, self.password)
+        except Exception:
+            with self._lock:
+                self._all.remove(client)
+            raise
+        return client
+
+    def release(self, client: FTPClient):
+        self._idle.put(client)
+
+    @contextmanager
+    def session(self):
+        client = self.acquire()
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def close(self, abort: bool = False):
+        """Đóng mọi phiên; phiên đang tải dở (không ở trạng thái rảnh) bị abort.
+
+        abort=True: abort tất cả, không gửi QUIT chờ server (dùng từ luồng UI khi đóng cửa sổ).
+        """
+        with self._lock:
+            clients, self._all = self._all, []
+        idle = set()
+        while True:
+            try:
+                idle.add(id(self._idle.get_nowait()))
+            except queue.Empty:
+                break
+        for c in clients:
+            if id(c) in idle and not abort:
+                c.close()
+            else:
+                c.abort()
 
 
 class App(tk.Tk):
@@ -194,10 +633,18 @@ class App(tk.Tk):
             
         self.ftp = FTPClient()
         self.bg_queue = queue.Queue()
+        self._log_buf: deque[str] = deque(maxlen=LOG_BUFFER_MAX)
+        self._log_lock = threading.Lock()
+        self._log_flush_pending = False
+        self._closing = False
+        self._active_pool: FTPPool | None = None
+        self._active_executor: ThreadPoolExecutor | None = None
+        self._active_extract_executor: ThreadPoolExecutor | None = None
+        self._extract_procs: set[multiprocessing.process.BaseProcess] = set()
         self.cfg = load_config()
 
         self._build_ui()
-        self._poll_queue()
+        self.bind("<<BgMessage>>", self._drain_queue)
 
         # preload config
         self.host_var.set(self.cfg.get("host", ""))
@@ -266,7 +713,7 @@ class App(tk.Tk):
         browser.pack(fill="both", expand=True, padx=10, pady=10)
 
         columns = ("name", "type", "size", "modify")
-        self.tree = ttk.Treeview(browser, columns=columns, show="headings")
+        self.tree = ttk.Treeview(browser, columns=columns, show="headings", selectmode="extended")
         self.tree.heading("name", text="Tên")
         self.tree.heading("type", text="Loại")
         # Đổi tiêu đề cột size vì sẽ hiển thị dạng KB/MB
@@ -313,13 +760,15 @@ class App(tk.Tk):
         ttk.Checkbutton(right, text="Ghi đè nếu trùng file / folder", variable=self.overwrite_var).pack(anchor="w", pady=8)
 
         self.selected_remote = tk.StringVar(value="")
+        self.selected_remotes: list[str] = []
+        self._entry_sizes: dict[str, int] = {}
         self.lbl_selected = ttk.Label(right, text="Chưa chọn file .rar", wraplength=260, justify="left")
         self.lbl_selected.pack(anchor="w", pady=(10,6))
 
         self.progress = ttk.Progressbar(right, orient="horizontal", mode="determinate", length=220)
         self.progress.pack(fill="x")
 
-        self.btn_download = ttk.Button(right, text="Tải về & Giải nén", command=self.on_download_extract, state="disabled")
+        self.btn_download = ttk.Button(right, text="Tải về & Giải nén", command=self.on_download_clicked, state="disabled")
         self.btn_download.pack(fill="x", pady=(10,0))
 
         self.log_text = tk.Text(self, height=7, state="disabled")
@@ -327,9 +776,23 @@ class App(tk.Tk):
 
         self._set_state_connected(False)
 
-    def log(self, msg: str):
+    def log(self, msg: str, wake: bool = True):
+        # An toàn khi gọi từ luồng nền: chỉ đưa vào buffer, luồng UI sẽ ghi theo lô
+        with self._log_lock:
+            self._log_buf.append(msg)
+        if wake:
+            self._wake()
+
+    def _flush_log(self):
+        self._log_flush_pending = False
+        with self._log_lock:
+            msgs = list(self._log_buf)
+            self._log_buf.clear()
+        if not msgs:
+            return
+        now_s = time.strftime('%H:%M:%S')
         self.log_text.configure(state="normal")
-        self.log_text.insert("end", f"[{time.strftime('%H:%M:%S')}] {msg}\n")
+        self.log_text.insert("end", "".join(f"[{now_s}] {m}\n" for m in msgs))
         self.log_text.see("end")
         self.log_text.configure(state="disabled")
 
@@ -366,21 +829,23 @@ class App(tk.Tk):
                         "remember": True
                     })
                     save_config(self.cfg)
-                self.bg_queue.put(("connected", None))
+                self._post("connected", None)
                 self.log("Kết nối thành công.")
                 self.refresh_listing()
             except Exception as e:
-                self.bg_queue.put(("error", f"Lỗi kết nối: {e}"))
+                self._post("error", f"Lỗi kết nối: {e}")
 
         threading.Thread(target=worker, daemon=True).start()
 
     def refresh_listing(self):
         def worker():
             try:
+                # Làm mới thủ công: bỏ qua cache
+                self.ftp.invalidate(self.ftp.current_path)
                 entries = self.ftp.listdir()
-                self.bg_queue.put(("listing", entries))
+                self._post("listing", entries)
             except Exception as e:
-                self.bg_queue.put(("error", f"Lỗi liệt kê: {e}"))
+                self._post("error", f"Lỗi liệt kê: {e}")
         threading.Thread(target=worker, daemon=True).start()
 
     def on_tree_double_click(self, event=None):
@@ -401,27 +866,33 @@ class App(tk.Tk):
                     else:
                         self.ftp.cwd(os.path.join(self.ftp.current_path, name).replace("\\", "/"))
                     entries = self.ftp.listdir()
-                    self.bg_queue.put(("listing", entries))
+                    self._post("listing", entries)
                 except Exception as e:
-                    self.bg_queue.put(("error", f"Không thể chuyển thư mục: {e}"))
+                    self._post("error", f"Không thể chuyển thư mục: {e}")
             threading.Thread(target=worker, daemon=True).start()
 
     def on_tree_select(self, event=None):
-        sel = self.tree.selection()
-        path = ""
-        enable = False
-        if sel:
-            item = self.tree.item(sel[0])
-            name, typ = item["values"][0], item["values"][1]
+        paths = []
+        for item_id in self.tree.selection():
+            item = self.tree.item(item_id)
+            name, typ = str(item["values"][0]), item["values"][1]
             if typ == "file" and name.lower().endswith(".rar"):
-                path = os.path.join(self.ftp.current_path, name).replace("\\", "/")
-                enable = True
-        self.selected_remote.set(path)
-        if path:
-            self.lbl_selected.config(text=f"Đã chọn: {path}")
+                paths.append(os.path.join(self.ftp.current_path, name).replace("\\", "/"))
+        self.selected_remotes = paths
+        self.selected_remote.set(paths[0] if paths else "")
+        if len(paths) > 1:
+            self.lbl_selected.config(text=f"Đã chọn {len(paths)} file .rar")
+        elif paths:
+            self.lbl_selected.config(text=f"Đã chọn: {paths[0]}")
         else:
             self.lbl_selected.config(text="Chưa chọn file .rar")
-        self.btn_download.config(state="normal" if enable else "disabled")
+        self.btn_download.config(state="normal" if paths else "disabled")
+
+    def on_download_clicked(self):
+        if len(self.selected_remotes) > 1:
+            self.on_download_multi()
+        else:
+            self.on_download_extract()
 
     def choose_download_dir(self):
         d = filedialog.askdirectory(title="Chọn thư mục tải về", initialdir=self.download_dir.get())
@@ -471,62 +942,223 @@ class App(tk.Tk):
         def worker():
             try:
                 self.log(f"Tải xuống: {remote_path} -> {local_path}")
+                last_put = [0.0]
+                mode_sent = [False]
                 def prog(done, total):
                     # Switch to determinate if total known
                     if total and total > 0:
-                        if self.progress["mode"] != "determinate":
-                            self.bg_queue.put(("progress_mode", "determinate"))
+                        if not mode_sent[0] and self.progress["mode"] != "determinate":
+                            mode_sent[0] = True
+                            self._post("progress_mode", "determinate")
                         pct = int(done * 100 / total)
-                        self.bg_queue.put(("progress", pct))
-                self.ftp.download_file(remote_path, str(local_path), progress_cb=prog, rest=rest)
-
-                self.bg_queue.put(("progress", 100))
+                        now = time.monotonic()
+                        # Giới hạn ~20 cập nhật/giây để không làm ngập hàng đợi UI
+                        if now - last_put[0] > PROGRESS_INTERVAL or pct == 100:
+                            last_put[0] = now
+                            self._post("progress", pct)
+                blocksize = int(self.cfg.get("blocksize", DEFAULT_BLOCKSIZE))
+                self.ftp.download_file(remote_path, str(local_path), progress_cb=prog, blocksize=blocksize, rest=rest)
+
+                self._post("progress", 100)
                 self.log("Tải xong. Bắt đầu giải nén...")
                 self._extract_rar(local_path, ex_dir, overwrite)
-                self.bg_queue.put(("done", f"Hoàn tất: Đã tải và giải nén vào {ex_dir}"))
+                self._post("done", f"Hoàn tất: Đã tải và giải nén vào {ex_dir}")
             except rarfile.NeedFirstVolume:
-                self.bg_queue.put(("error", "Tập tin là RAR nhiều phần. Hãy tải đủ các phần (chọn *.part1.rar hoặc .rar đầu tiên)."))
+                self._post("error", "Tập tin là RAR nhiều phần. Hãy tải đủ các phần (chọn *.part1.rar hoặc .rar đầu tiên).")
             except rarfile.RarCannotExec:
-                self.bg_queue.put(("error", "Không tìm thấy chương trình giải nén (unrar/unar/bsdtar). Hãy cài đặt và thêm vào PATH."))
+                self._post("error", "Không tìm thấy chương trình giải nén (unrar/unar/bsdtar). Hãy cài đặt và thêm vào PATH.")
             except Exception as e:
-                self.bg_queue.put(("error", f"Lỗi: {e}"))
+                self._post("error", f"Lỗi: {e}")
             finally:
-                self.bg_queue.put(("enable_download", None))
+                self._post("enable_download", None)
 
         threading.Thread(target=worker, daemon=True).start()
 
-    def _extract_rar(self, rar_path: Path, dest_dir: Path, overwrite: bool):
-        with rarfile.RarFile(rar_path) as rf:
-            for m in rf.infolist():
-                name_posix = Path(m.filename).as_posix().lstrip("/")
-                target = dest_dir / name_posix
-                # Guard against path traversal
-                try:
-                    target_resolved_parent = (target.parent if m.is_dir() else target).resolve().parent
-                except FileNotFoundError:
-                    target_resolved_parent = target.parent.resolve()
-                if not str(target_resolved_parent).startswith(str(dest_dir.resolve())):
-                    raise Exception(f"Unsafe path in archive: {m.filename}")
-                if m.is_dir():
-                    (dest_dir / name_posix).mkdir(parents=True, exist_ok=True)
-                    continue
-                # Ensure parent
-                (dest_dir / name_posix).parent.mkdir(parents=True, exist_ok=True)
-                # Overwrite logic
-                target_file = dest_dir / name_posix
-                if target_file.exists() and overwrite:
+    def on_download_multi(self):
+        remotes = list(self.selected_remotes)
+        if not remotes:
+            messagebox.showinfo("Chọn file", "Hãy chọn một file .rar trước.")
+            return
+        if self.ftp.credentials is None:
+            messagebox.showwarning("Chưa kết nối", "Hãy kết nối FTP trước.")
+            return
+        dl_dir = Path(self.download_dir.get()).expanduser()
+        ex_dir = Path(self.extract_dir.get()).expanduser()
+        dl_dir.mkdir(parents=True, exist_ok=True)
+        ex_dir.mkdir(parents=True, exist_ok=True)
+        overwrite = self.overwrite_var.get()
+
+        jobs = [(r, dl_dir / Path(r).name) for r in remotes]
+        resume = False
+        if any(local.exists() for _, local in jobs):
+            ans = messagebox.askyesnocancel("Tệp đã tồn tại",
+                                            "Một số tệp đã tồn tại.\nYes: Tiếp tục tải (resume)\nNo: Tải lại từ đầu (ghi đè)\nCancel: Hủy")
+            if ans is None:
+                return
+            resume = ans
+
+        # Dùng đúng phiên đã tạo ra listing, không đọc lại ô nhập (có thể đã bị sửa)
+        pool = FTPPool(*self.ftp.credentials, size=min(int(self.cfg.get("pool_size", DEFAULT_POOL_SIZE)), len(jobs)))
+        blocksize = int(self.cfg.get("blocksize", DEFAULT_BLOCKSIZE))
+
+        # Tổng dung lượng lấy từ listing; tiến trình là tổng byte của mọi file
+        grand_total = sum(self._entry_sizes.get(Path(r).name, 0) for r in remotes)
+        done_by_file = {r: 0 for r in remotes}
+        lock = threading.Lock()
+        last_put = [0.0]
+
+        self.progress.configure(mode="indeterminate" if not grand_total else "determinate", value=0, maximum=100)
+        if self.progress["mode"] == "indeterminate":
+            self.progress.start(100)
+        self.btn_download.configure(state="disabled")
+
+        def download_one(remote_path, local_path):
+            rest = local_path.stat().st_size if resume and local_path.exists() else 0
+            def prog(done, total):
+                if not grand_total:
+                    return
+                with lock:
+                    done_by_file[remote_path] = done
+                    pct = min(100, int(sum(done_by_file.values()) * 100 / grand_total))
+                    now = time.monotonic()
+                    if now - last_put[0] <= PROGRESS_INTERVAL and pct != 100:
+                        return
+                    last_put[0] = now
+                self._post("progress", pct, wake=False)
+            with pool.session() as client:
+                self.log(f"Tải xuống: {remote_path} -> {local_path}", wake=False)
+                client.download_file(remote_path, str(local_path), progress_cb=prog, blocksize=blocksize, rest=rest)
+
+        # Nhóm theo phần đầu: bộ nhiều phần chỉ giải nén khi đã tải đủ mọi phần của nó
+        groups: dict[str, list[Path]] = {}
+        for _, local in jobs:
+            groups.setdefault(_volume_group(local.name), []).append(local)
+
+        def worker():
+            ex = ThreadPoolExecutor(max_workers=pool.size)
+            # Một luồng giải nén: mỗi lần một tiến trình con, chạy song song với các file còn đang tải
+            ex_extract = ThreadPoolExecutor(max_workers=1)
+            # Giữ tham chiếu để on_close huỷ được (worker của executor bị join khi thoát)
+            self._active_pool, self._active_executor, self._active_extract_executor = pool, ex, ex_extract
+            try:
+                if self._closing:
+                    return
+                remaining = {key: len(parts) for key, parts in groups.items()}
+                missing_first = []
+                extracting = []
+
+                def extract_group(key):
+                    first = next((p for p in groups[key] if p.name.lower() == key), None)
+                    if first is None:
+                        missing_first.extend(p.name for p in groups[key])
+                        return
+                    if self._closing:
+                        return
+                    self.log(f"Giải nén: {first.name}", wake=False)
                     try:
-                        if target_file.is_file():
-                            target_file.unlink()
-                        else:
-                            shutil.rmtree(target_file)
-                    except Exception:
-                        pass
-                if (not target_file.exists()) or overwrite:
-                    # Extract (rarfile will honor member path relative to 'path')
-                    rf.extract(m, path=dest_dir)
-
-    def _poll_queue(self):
+                        self._extract_rar(first, ex_dir, overwrite)
+                    except rarfile.NeedFirstVolume:
+                        missing_first.append(first.name)
+
+                try:
+                    futures = {ex.submit(download_one, r, l): l for r, l in jobs}
+                    pending = set(futures)
+                    while pending:
+                        # Luồng pool chỉ xếp hàng; luồng điều phối (daemon) đánh thức UI định kỳ
+                        done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+                        self._wake()
+                        for f in done:
+                            f.result()
+                            key = _volume_group(futures[f].name)
+                            remaining[key] -= 1
+                            if not remaining[key]:
+                                extracting.append(ex_extract.submit(extract_group, key))
+                finally:
+                    ex.shutdown(wait=not self._closing, cancel_futures=True)
+                if self._closing:
+                    return
+                self._post("progress", 100)
+                self.log(f"Tải xong {len(jobs)} file. Chờ giải nén xong...")
+                try:
+                    while extracting:
+                        # Giải nén không báo tiến trình; vẫn đánh thức UI để log hiện ra
+                        done, pending = wait(extracting, timeout=PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+                        self._wake()
+                        for f in done:
+                            f.result()
+                        extracting = list(pending)
+                finally:
+                    ex_extract.shutdown(wait=not self._closing, cancel_futures=True)
+                if self._closing:
+                    return
+                if missing_first:
+                    self._post("error", "Tập tin là RAR nhiều phần. Hãy tải đủ các phần (chọn *.part1.rar hoặc .rar đầu tiên): "
+                               + ", ".join(missing_first))
+                    return
+                self._post("done", f"Hoàn tất: Đã tải và giải nén {len(jobs)} file vào {ex_dir}")
+            except rarfile.RarCannotExec:
+                self._post("error", "Không tìm thấy chương trình giải nén (unrar/unar/bsdtar). Hãy cài đặt và thêm vào PATH.")
+            except Exception as e:
+                self._post("error", f"Lỗi: {e}")
+            finally:
+                ex_extract.shutdown(wait=False, cancel_futures=True)
+                self._active_pool = self._active_executor = self._active_extract_executor = None
+                pool.close()
+                self._post("enable_download", None)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _extract_rar(self, rar_path: Path, dest_dir: Path, overwrite: bool):
+        # Giải nén trong tiến trình con để không tranh GIL với luồng tải/UI.
+        # "spawn" thay cho fork: tiến trình này có Tk và nhiều luồng (có thể đang giữ lock).
+        if self._closing:
+            raise Exception("Đã huỷ giải nén")
+        ctx = multiprocessing.get_context("spawn")
+        recv_conn, send_conn = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_extract_rar_child, args=(send_conn, str(rar_path), str(dest_dir), overwrite), daemon=True)
+        proc.start()
+        send_conn.close()
+        self._extract_procs.add(proc)
+        try:
+            try:
+                status, res = recv_conn.recv()
+            except EOFError:
+                # Tiến trình con bị terminate (đóng cửa sổ) hoặc chết bất thường
+                raise Exception("Tiến trình giải nén đã dừng")
+        finally:
+            recv_conn.close()
+            proc.join()
+            self._extract_procs.discard(proc)
+        if status == "err":
+            raise res
+        if res is not None:
+            _, msg, volume = res
+            raise rarfile.NeedFirstVolume(msg, volume)
+
+    def _post(self, kind: str, payload=None, wake: bool = True):
+        """Gửi thông điệp từ luồng nền và đánh thức luồng UI (không cần polling).
+
+        wake=False: chỉ xếp hàng; dùng trong luồng của executor (không daemon) để
+        chúng không bao giờ chặn chờ Tk — luồng điều phối sẽ đánh thức thay.
+        """
+        if self._closing:
+            return
+        self.bg_queue.put((kind, payload))
+        if wake:
+            self._wake()
+
+    def _wake(self):
+        # Sau khi on_close bắt đầu, mainloop có thể kết thúc trước khi xử lý sự kiện
+        # và luồng gọi event_generate sẽ chờ mãi
+        if self._closing:
+            return
+        try:
+            self.event_generate("<<BgMessage>>", when="tail")
+        except (tk.TclError, RuntimeError):
+            # Cửa sổ đã đóng / mainloop chưa chạy
+            pass
+
+    def _drain_queue(self, event=None):
         try:
             while True:
                 kind, payload = self.bg_queue.get_nowait()
@@ -534,12 +1166,14 @@ class App(tk.Tk):
                     self._set_state_connected(True)
                     self.lbl_pwd.config(text=f"Đường dẫn hiện tại: {self.ftp.current_path}")
                 elif kind == "listing":
-                    for i in self.tree.get_children():
-                        self.tree.delete(i)
+                    self._entry_sizes = {e["name"]: e.get("size", 0) for e in payload if e["type"] == "file"}
+                    # Ẩn cột trong lúc nạp lại để tránh vẽ lại theo từng dòng
+                    self.tree.configure(displaycolumns=())
+                    self.tree.delete(*self.tree.get_children())
+                    insert = self.tree.insert
                     for e in payload:
-                        size_str = FTPClient.format_size(e.get("size", 0)) if e.get("size") else ""
-                        date_str = FTPClient.format_date(e.get("modify", "")) if e.get("modify") else ""
-                        self.tree.insert("", "end", values=(e["name"], e["type"], size_str, date_str))
+                        insert("", "end", values=(e["name"], e["type"], e["size_str"], e["modify_str"]))
+                    self.tree.configure(displaycolumns="#all")
                     self.lbl_pwd.config(text=f"Đường dẫn hiện tại: {self.ftp.current_path}")
                 elif kind == "progress_mode":
                     # switch from indeterminate to determinate
@@ -562,10 +1196,13 @@ class App(tk.Tk):
                     pass
         except queue.Empty:
             pass
-        finally:
-            self.after(120, self._poll_queue)
+        if self._log_buf and not self._log_flush_pending:
+            self._log_flush_pending = True
+            self.after(LOG_FLUSH_MS, self._flush_log)
 
     def on_close(self):
+        # Đặt trước tiên: từ đây luồng nền không gọi vào Tk nữa
+        self._closing = True
         try:
             if self.remember_var.get():
                 self.cfg.update({
@@ -580,10 +1217,20 @@ class App(tk.Tk):
                 save_config(self.cfg)
         except Exception:
             pass
+        # Huỷ các transfer đang chạy để tiến trình không tiếp tục tải sau khi đóng cửa sổ
+        ex, pool = self._active_executor, self._active_pool
+        if ex is not None:
+            ex.shutdown(wait=False, cancel_futures=True)
+        if pool is not None:
+            pool.close(abort=True)
+        if self._active_extract_executor is not None:
+            self._active_extract_executor.shutdown(wait=False, cancel_futures=True)
         try:
-            self.ftp.close()
+            self.ftp.abort()
         except Exception:
             pass
+        for proc in list(self._extract_procs):
+            proc.terminate()
         self.destroy()
 
 